@@ -10,12 +10,16 @@ https://sr.ht/~partytax/unofficial-municode-api-documentation/
 """
 
 import asyncio
-import json
+import hashlib
 import logging
-from typing import Any, Dict, List, Optional
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from urllib.parse import quote, urljoin
 
 import httpx
+import orjson
 from mcp.server import Server
 from mcp.server.models import InitializationOptions
 from mcp.types import (
@@ -29,88 +33,374 @@ from mcp.types import (
 )
 from pydantic import BaseModel
 
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # Redis caching is optional
+    aioredis = None
+    RedisError = OSError
+
+try:
+    import zstandard
+except ImportError:  # Compression of Redis payloads is optional
+    zstandard = None
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# httpx logs every request at INFO; keep per-request logging off the hot path
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
 # Municode API base URL
 MUNICODE_API_BASE = "https://api.municode.com"
 MUNICODE_LIBRARY_BASE = "https://library.municode.com"
 
+# Fixed trailing parameters for /search, pre-encoded once
+SEARCH_QUERY_DEFAULTS = (
+    "&isAutocomplete=false&mode=standard&sort=0"
+    "&fragmentSize=200&contentTypeId=&stateId=0"
+)
+
+# Seconds an idle pooled connection is kept open
+POOL_KEEPALIVE_EXPIRY = 30.0
+
+# Interval in seconds between keepalive requests; must stay below the pool's
+# keepalive expiry so idle connections are not dropped between pings
+KEEPALIVE_INTERVAL = POOL_KEEPALIVE_EXPIRY - 5.0
+
+# Stop keepalive pings once no API request has been made for this many seconds
+KEEPALIVE_IDLE_TIMEOUT = 5 * 60
+
+# Translation table for library URL slugs: spaces become underscores, commas are dropped
+_SLUG_TABLE = str.maketrans({" ": "_", ",": None})
+
+# Limits for get_code_subtree: maximum depth, total nodes returned below the
+# starting level, and concurrent TOC requests
+MAX_TOC_DEPTH = 3
+MAX_TOC_NODES = 200
+TOC_FETCH_CONCURRENCY = 8
+
+# Optional Redis cache for API responses (e.g., redis://localhost:6379/0)
+REDIS_URL = os.environ.get("MUNICODE_REDIS_URL")
+CACHE_KEY_PREFIX = "munidocs:"
+
+# Seconds to wait on Redis before falling back to the network, so an
+# unreachable cache never stalls tool calls for the OS TCP timeout
+REDIS_TIMEOUT = 1.0
+
+# Cache lifetimes in seconds, per endpoint
+CACHE_TTL_STATES = 30 * 24 * 60 * 60
+CACHE_TTL_CLIENTS = 24 * 60 * 60
+CACHE_TTL_CONTENT = 6 * 60 * 60
+CACHE_TTL_JOBS = 60 * 60
+CACHE_TTL_SEARCH = 60 * 60
+
+# In-process cache in front of Redis for responses repeated within a session,
+# bounded by entry count and by the approximate memory held by decoded responses
+MEMORY_CACHE_SIZE = 256
+MEMORY_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Decoded JSON (dicts, lists, str objects) takes roughly this many times the
+# size of the serialized body; used to estimate an entry's memory footprint
+MEMORY_CACHE_DECODED_FACTOR = 4
+MEMORY_CACHE_TTL = 60 * 60
+
+# Lifetime of resolved (client_id, job_id, product_id) lookups; kept no longer
+# than the ClientContent responses they are derived from, so a newly published
+# job is picked up
+PRODUCT_CACHE_TTL = min(CACHE_TTL_CLIENTS, MEMORY_CACHE_TTL)
+
+# Sentinel for cache misses, since None is a valid JSON response
+_MISSING = object()
+
+# Frame header identifying zstd-compressed cache entries
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_zstd_compressor = zstandard.ZstdCompressor(level=3) if zstandard else None
+_zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+# Errors raised by corrupt or foreign cache entries
+_CACHE_DECODE_ERRORS = (orjson.JSONDecodeError, zstandard.ZstdError) if zstandard else (orjson.JSONDecodeError,)
+
+
+def _cache_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Build a cache key from a request URL and its query parameters."""
+    raw = url.encode() + orjson.dumps(params, option=orjson.OPT_SORT_KEYS)
+    return CACHE_KEY_PREFIX + hashlib.blake2b(raw).hexdigest()
+
+
+def _normalize_search_text(search_text: str) -> str:
+    """Collapse runs of whitespace so trivially different queries share a cache entry.
+    
+    Case is left untouched: the normalized text is what Municode receives, and
+    its handling of case and operators is not documented.
+    """
+    return " ".join(search_text.split())
+
+
+def _is_code_product(product: Dict[str, Any]) -> bool:
+    """Check whether a client product is a code of ordinances."""
+    return "code" in (product.get("ProductName") or "").lower()
+
+
+def _pretty(obj: Any, prefix: str = "") -> str:
+    """Serialize an API response as indented JSON for tool output, after an optional heading."""
+    return prefix + orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+
 
 class MunicodeClient:
     """HTTP client for interacting with Municode API."""
     
     def __init__(self):
+        # All requests go to a single host, so one pooled HTTP/2 client lets
+        # every tool call reuse the same TLS connection.
         self.client = httpx.AsyncClient(
-            timeout=30.0,
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=20,
+                keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+            ),
             headers={
                 "User-Agent": "MCP-Municode-Server/1.0",
                 "Accept": "application/json",
             }
         )
+        self.redis = None
+        if REDIS_URL:
+            if aioredis is None:
+                logger.warning("MUNICODE_REDIS_URL is set but the redis package is not installed")
+            else:
+                try:
+                    self.redis = aioredis.from_url(
+                        REDIS_URL,
+                        socket_connect_timeout=REDIS_TIMEOUT,
+                        socket_timeout=REDIS_TIMEOUT,
+                    )
+                except ValueError as e:
+                    logger.warning("Ignoring invalid MUNICODE_REDIS_URL: %s", e)
+        self._memory_cache: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._memory_bytes = 0
+        self.last_used = time.monotonic()
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._inflight: Dict[str, "asyncio.Future[Any]"] = {}
+        self._product_cache: Dict[Tuple[str, str], Tuple[float, Tuple[int, Optional[int], Optional[int]]]] = {}
     
     async def close(self):
         """Close the HTTP client."""
         await self.client.aclose()
+        if self.redis is not None:
+            await self.redis.aclose()
+    
+    async def _get(self, url: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Any, int]:
+        """Issue a GET request against the Municode API.
+        
+        Returns the decoded JSON body and its size in bytes.
+        """
+        response = await self.client.get(url, params=params)
+        response.raise_for_status()
+        return orjson.loads(response.content), len(response.content)
+    
+    def _memory_get(self, key: str) -> Any:
+        """Look up a response in the in-process cache."""
+        entry = self._memory_cache.get(key)
+        if entry is None:
+            return _MISSING
+        expires, _, data = entry
+        if expires < time.monotonic():
+            self._memory_evict(key)
+            return _MISSING
+        self._memory_cache.move_to_end(key)
+        return data
+    
+    def _memory_set(self, key: str, data: Any, size: int, ttl: int) -> None:
+        """Store a response in the in-process cache, evicting least recently used entries.
+        
+        size is the serialized JSON size; the decoded footprint is estimated from it.
+        """
+        size *= MEMORY_CACHE_DECODED_FACTOR
+        if size > MEMORY_CACHE_MAX_BYTES:
+            return
+        if key in self._memory_cache:
+            self._memory_evict(key)
+        self._memory_cache[key] = (time.monotonic() + ttl, size, data)
+        self._memory_bytes += size
+        while len(self._memory_cache) > MEMORY_CACHE_SIZE or self._memory_bytes > MEMORY_CACHE_MAX_BYTES:
+            self._memory_evict(next(iter(self._memory_cache)))
+    
+    def _memory_evict(self, key: str) -> None:
+        """Remove a response from the in-process cache."""
+        _, size, _ = self._memory_cache.pop(key)
+        self._memory_bytes -= size
+    
+    async def _redis_get(self, key: str) -> Tuple[Any, int]:
+        """Look up a response in Redis, if configured.
+        
+        Returns the decoded JSON body and its uncompressed size in bytes.
+        """
+        if self.redis is None:
+            return _MISSING, 0
+        try:
+            cached = await self.redis.get(key)
+        except RedisError as e:
+            logger.warning("Redis cache read failed: %s", e)
+            return _MISSING, 0
+        if cached is None:
+            return _MISSING, 0
+        try:
+            if cached.startswith(ZSTD_MAGIC):
+                if _zstd_decompressor is None:
+                    return _MISSING, 0
+                cached = _zstd_decompressor.decompress(cached)
+            return orjson.loads(cached), len(cached)
+        except _CACHE_DECODE_ERRORS as e:
+            logger.warning("Discarding unreadable Redis cache entry %s: %s", key, e)
+            try:
+                await self.redis.delete(key)
+            except RedisError as e:
+                logger.warning("Redis cache delete failed: %s", e)
+            return _MISSING, 0
+    
+    async def _redis_set(self, key: str, data: Any, ttl: int) -> None:
+        """Store a response in Redis, if configured."""
+        if self.redis is None:
+            return
+        payload = orjson.dumps(data)
+        if _zstd_compressor is not None:
+            payload = _zstd_compressor.compress(payload)
+        try:
+            await self.redis.set(key, payload, ex=ttl)
+        except RedisError as e:
+            logger.warning("Redis cache write failed: %s", e)
+    
+    async def _cached_get(self, url: str, params: Optional[Dict[str, Any]] = None, ttl: int = CACHE_TTL_CONTENT) -> Any:
+        """GET a Municode endpoint, serving repeated requests from the in-process cache or Redis.
+        
+        Concurrent misses for the same request share a single in-flight fetch.
+        Results are shared with the cache and every other caller, so callers
+        must not mutate them; copy before modifying.
+        """
+        self.last_used = time.monotonic()
+        key = _cache_key(url, params)
+        data = self._memory_get(key)
+        if data is not _MISSING:
+            return data
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, url, params, ttl))
+            self._inflight[key] = task
+        # Shield the shared fetch so one cancelled caller doesn't cancel it for the others
+        return await asyncio.shield(task)
+    
+    async def _load(self, key: str, url: str, params: Optional[Dict[str, Any]], ttl: int) -> Any:
+        """Fetch a response from Redis or the network and populate the caches."""
+        try:
+            data, size = await self._redis_get(key)
+            if data is _MISSING:
+                data, size = await self._get(url, params)
+                await self._redis_set(key, data, ttl)
+            
+            self._memory_set(key, data, size, min(ttl, MEMORY_CACHE_TTL))
+            return data
+        finally:
+            self._inflight.pop(key, None)
     
     async def get_states(self, state_abbr: str) -> Dict[str, Any]:
-        """Get state information by abbreviation."""
+        """Get state information by abbreviation.
+        
+        State records never change, so they are kept for the life of the process.
+        """
+        state_abbr = state_abbr.upper()
+        if state_abbr in self._states:
+            return self._states[state_abbr]
+        
         url = f"{MUNICODE_API_BASE}/States/abbr"
         params = {"stateAbbr": state_abbr}
-        response = await self.client.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        state = await self._cached_get(url, params, ttl=CACHE_TTL_STATES)
+        if state:
+            self._states[state_abbr] = state
+        return state
     
     async def get_clients_by_state(self, state_abbr: str) -> List[Dict[str, Any]]:
         """Get all Municode clients in a state."""
         url = f"{MUNICODE_API_BASE}/Clients/stateAbbr"
         params = {"stateAbbr": state_abbr}
-        response = await self.client.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return await self._cached_get(url, params, ttl=CACHE_TTL_CLIENTS)
     
     async def get_client_by_name(self, client_name: str, state_abbr: str) -> Dict[str, Any]:
         """Get client information by name and state."""
         url = f"{MUNICODE_API_BASE}/Clients/name"
         params = {"clientName": client_name, "stateAbbr": state_abbr}
-        response = await self.client.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return await self._cached_get(url, params, ttl=CACHE_TTL_CLIENTS)
     
     async def get_client_content(self, client_id: int) -> Dict[str, Any]:
         """Get all products a client subscribes to."""
         url = f"{MUNICODE_API_BASE}/ClientContent/{client_id}"
-        response = await self.client.get(url)
-        response.raise_for_status()
-        return response.json()
+        return await self._cached_get(url, ttl=CACHE_TTL_CLIENTS)
     
     async def get_product_by_name(self, client_id: int, product_name: str) -> Dict[str, Any]:
         """Get product information by client and product name."""
         url = f"{MUNICODE_API_BASE}/Products/name"
         params = {"clientId": client_id, "productName": product_name}
-        response = await self.client.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return await self._cached_get(url, params, ttl=CACHE_TTL_CLIENTS)
     
     async def get_latest_job(self, job_id: int) -> Dict[str, Any]:
         """Get the latest job information."""
         url = f"{MUNICODE_API_BASE}/Jobs/latest/{job_id}"
-        response = await self.client.get(url)
-        response.raise_for_status()
-        return response.json()
+        return await self._cached_get(url, ttl=CACHE_TTL_JOBS)
     
     async def get_toc_children(self, job_id: int, product_id: int, node_id: str = "10121") -> List[Dict[str, Any]]:
         """Get children of a node in the document tree."""
-        url = f"{MUNICODE_API_BASE}/codesToc/children"
-        params = {
-            "jobId": job_id,
-            "productId": product_id,
-            "nodeId": node_id
-        }
-        response = await self.client.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        url = (
+            f"{MUNICODE_API_BASE}/codesToc/children"
+            f"?jobId={job_id}&productId={product_id}&nodeId={quote(str(node_id), safe='')}"
+        )
+        return await self._cached_get(url, ttl=CACHE_TTL_CONTENT)
+    
+    async def get_toc_subtree(
+        self,
+        job_id: int,
+        product_id: int,
+        node_id: str = "10121",
+        depth: int = 2,
+        max_nodes: int = MAX_TOC_NODES
+    ) -> List[Dict[str, Any]]:
+        """Get the descendants of a node down to the given depth.
+        
+        Levels are filled breadth-first, fetching each level's children in concurrent
+        batches of TOC_FETCH_CONCURRENCY; nested children are returned under "Children".
+        Expansion stops at the first child list that would put more than max_nodes
+        nodes below the first level, so no further batches are requested. Nodes left
+        without a "Children" key can be expanded with another call.
+        """
+        # Work on copies so the cached TOC lists are never mutated
+        tree = [dict(node) for node in await self.get_toc_children(job_id, product_id, node_id)]
+        level = tree
+        node_count = 0
+        
+        for _ in range(depth - 1):
+            candidates = [node for node in level if node.get("Id") and node.get("HasChildren") is not False]
+            next_level: List[Dict[str, Any]] = []
+            
+            for start in range(0, len(candidates), TOC_FETCH_CONCURRENCY):
+                if node_count >= max_nodes:
+                    return tree
+                batch = candidates[start:start + TOC_FETCH_CONCURRENCY]
+                results = await asyncio.gather(
+                    *(self.get_toc_children(job_id, product_id, node["Id"]) for node in batch)
+                )
+                for node, children in zip(batch, results):
+                    if node_count + len(children) > max_nodes:
+                        return tree
+                    node_count += len(children)
+                    node["Children"] = [dict(child) for child in children]
+                    next_level.extend(node["Children"])
+            
+            level = next_level
+        
+        return tree
     
     async def get_codes_content(self, job_id: int, product_id: int, node_id: str) -> Dict[str, Any]:
         """Get content of a specific node in the document tree."""
@@ -120,9 +410,39 @@ class MunicodeClient:
             "productId": product_id,
             "nodeId": node_id
         }
-        response = await self.client.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return await self._cached_get(url, params, ttl=CACHE_TTL_CONTENT)
+    
+    async def resolve_code_product(
+        self,
+        municipality_name: str,
+        state_abbr: str
+    ) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        """Resolve a municipality to its client ID and code of ordinances job/product IDs.
+        
+        Returns (client_id, job_id, product_id); missing values are None.
+        """
+        cache_key = (municipality_name.lower(), state_abbr.upper())
+        entry = self._product_cache.get(cache_key)
+        if entry is not None:
+            expires, resolved = entry
+            if expires >= time.monotonic():
+                return resolved
+            del self._product_cache[cache_key]
+        
+        client_info = await self.get_client_by_name(municipality_name, state_abbr)
+        client_id = client_info.get("ClientID")
+        if not client_id:
+            return None, None, None
+        
+        client_content = await self.get_client_content(client_id)
+        
+        code_product = next((p for p in client_content if _is_code_product(p)), None)
+        if code_product:
+            resolved = (client_id, code_product.get("Id"), code_product.get("ProductID"))
+        else:
+            resolved = (client_id, None, None)
+        self._product_cache[cache_key] = (time.monotonic() + PRODUCT_CACHE_TTL, resolved)
+        return resolved
     
     async def search_munidocs(
         self,
@@ -134,24 +454,22 @@ class MunicodeClient:
         is_advanced: bool = False
     ) -> Dict[str, Any]:
         """Search MuniDocs for a word or phrase."""
-        url = f"{MUNICODE_API_BASE}/search"
-        params = {
-            "clientId": client_id,
-            "searchText": search_text,
-            "pageNum": page_num,
-            "pageSize": page_size,
-            "titlesOnly": titles_only,
-            "isAdvanced": is_advanced,
-            "isAutocomplete": False,
-            "mode": "standard",
-            "sort": 0,
-            "fragmentSize": 200,
-            "contentTypeId": "",
-            "stateId": 0
-        }
-        response = await self.client.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        search_text = _normalize_search_text(search_text)
+        url = (
+            f"{MUNICODE_API_BASE}/search?clientId={client_id}"
+            f"&searchText={quote(search_text, safe='')}"
+            f"&pageNum={page_num}&pageSize={page_size}"
+            f"&titlesOnly={str(titles_only).lower()}&isAdvanced={str(is_advanced).lower()}"
+            f"{SEARCH_QUERY_DEFAULTS}"
+        )
+        results = await self._cached_get(url, ttl=CACHE_TTL_SEARCH)
+        
+        # Municode can return more hits than requested; trim to the page size
+        # without mutating the cached response.
+        hits = results.get("Hits") if isinstance(results, dict) else None
+        if hits and len(hits) > page_size:
+            results = {**results, "Hits": hits[:page_size]}
+        return results
 
 
 # Initialize the MCP server
@@ -308,202 +626,241 @@ async def handle_list_tools() -> List[Tool]:
                 },
                 "required": ["municipality_name", "state_abbr"]
             }
+        ),
+        Tool(
+            name="get_code_subtree",
+            description=(
+                "Get several levels of a municipality's code table of contents in one call. "
+                f"At most {MAX_TOC_NODES} nested nodes are returned; nodes without a "
+                "Children list can be expanded with another call."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "municipality_name": {
+                        "type": "string",
+                        "description": "Name of the city, county, or municipality"
+                    },
+                    "state_abbr": {
+                        "type": "string",
+                        "description": "Two-character US state abbreviation"
+                    },
+                    "node_id": {
+                        "type": "string",
+                        "description": "Optional node ID to start from (defaults to root)",
+                        "default": "10121"
+                    },
+                    "depth": {
+                        "type": "integer",
+                        "description": f"Number of levels to retrieve (default: 2, max: {MAX_TOC_DEPTH})",
+                        "default": 2
+                    }
+                },
+                "required": ["municipality_name", "state_abbr"]
+            }
         )
     ]
 
 
+async def _handle_get_states_info(arguments: Dict[str, Any]) -> List[TextContent]:
+    """Get information about a US state."""
+    state_abbr = arguments["state_abbr"].upper()
+    result = await municode_client.get_states(state_abbr)
+    return [TextContent(type="text", text=_pretty(result))]
+
+
+async def _handle_list_municipalities(arguments: Dict[str, Any]) -> List[TextContent]:
+    """List the Municode municipalities in a state."""
+    state_abbr = arguments["state_abbr"].upper()
+    clients = await municode_client.get_clients_by_state(state_abbr)
+    
+    # Format the output for better readability
+    formatted_clients = []
+    for client in clients:
+        formatted_clients.append({
+            "name": client.get("ClientName", "Unknown"),
+            "id": client.get("ClientID"),
+            "population_range": client.get("PopRangeId"),
+            "classification": client.get("ClassificationId"),
+            "website": client.get("Website"),
+            "city": client.get("City"),
+            "zip_code": client.get("ZipCode")
+        })
+    
+    return [TextContent(
+        type="text", 
+        text=_pretty(formatted_clients, f"Found {len(formatted_clients)} municipalities in {state_abbr}:\n\n")
+    )]
+
+
+async def _handle_get_municipality_info(arguments: Dict[str, Any]) -> List[TextContent]:
+    """Get a municipality's client record and available products."""
+    municipality_name = arguments["municipality_name"]
+    state_abbr = arguments["state_abbr"].upper()
+    
+    # The resolved client ID is cached, so on repeat calls both lookups can run at once
+    client_id, _, _ = await municode_client.resolve_code_product(municipality_name, state_abbr)
+    
+    if client_id:
+        client_info, client_content = await asyncio.gather(
+            municode_client.get_client_by_name(municipality_name, state_abbr),
+            municode_client.get_client_content(client_id)
+        )
+        
+        result = {
+            "client_info": client_info,
+            "available_products": client_content
+        }
+    else:
+        client_info = await municode_client.get_client_by_name(municipality_name, state_abbr)
+        result = {"client_info": client_info}
+    
+    return [TextContent(type="text", text=_pretty(result))]
+
+
+async def _handle_get_code_structure(arguments: Dict[str, Any]) -> List[TextContent]:
+    """Get the table of contents for a municipality's code."""
+    municipality_name = arguments["municipality_name"]
+    state_abbr = arguments["state_abbr"].upper()
+    node_id = arguments.get("node_id", "10121")
+    
+    client_id, job_id, product_id = await municode_client.resolve_code_product(municipality_name, state_abbr)
+    
+    if not client_id:
+        return [TextContent(type="text", text=f"Municipality '{municipality_name}' not found in {state_abbr}")]
+    
+    if not job_id:
+        return [TextContent(type="text", text="No code of ordinances found for this municipality")]
+    
+    # Get table of contents
+    toc = await municode_client.get_toc_children(job_id, product_id, node_id)
+    
+    return [TextContent(
+        type="text",
+        text=_pretty(toc, f"Code structure for {municipality_name}, {state_abbr}:\n\n")
+    )]
+
+
+async def _handle_get_code_section(arguments: Dict[str, Any]) -> List[TextContent]:
+    """Get the content of a code section."""
+    municipality_name = arguments["municipality_name"]
+    state_abbr = arguments["state_abbr"].upper()
+    node_id = arguments["node_id"]
+    
+    client_id, job_id, product_id = await municode_client.resolve_code_product(municipality_name, state_abbr)
+    
+    if not client_id:
+        return [TextContent(type="text", text=f"Municipality '{municipality_name}' not found in {state_abbr}")]
+    
+    if not job_id:
+        return [TextContent(type="text", text="No code of ordinances found for this municipality")]
+    
+    # Get the content
+    content = await municode_client.get_codes_content(job_id, product_id, node_id)
+    
+    return [TextContent(
+        type="text",
+        text=_pretty(content, f"Content for node {node_id} in {municipality_name}, {state_abbr}:\n\n")
+    )]
+
+
+async def _handle_search_municipal_codes(arguments: Dict[str, Any]) -> List[TextContent]:
+    """Search a municipality's codes."""
+    municipality_name = arguments["municipality_name"]
+    state_abbr = arguments["state_abbr"].upper()
+    search_query = arguments["search_query"]
+    page_size = arguments.get("page_size", 10)
+    page_number = arguments.get("page_number", 1)
+    titles_only = arguments.get("titles_only", False)
+    
+    client_id, _, _ = await municode_client.resolve_code_product(municipality_name, state_abbr)
+    
+    if not client_id:
+        return [TextContent(type="text", text=f"Municipality '{municipality_name}' not found in {state_abbr}")]
+    
+    # Perform search
+    search_results = await municode_client.search_munidocs(
+        client_id=client_id,
+        search_text=search_query,
+        page_num=page_number,
+        page_size=page_size,
+        titles_only=titles_only
+    )
+    
+    return [TextContent(
+        type="text",
+        text=_pretty(search_results, f"Search results for '{search_query}' in {municipality_name}, {state_abbr}:\n\n")
+    )]
+
+
+async def _handle_get_municipality_url(arguments: Dict[str, Any]) -> List[TextContent]:
+    """Build the Municode Library URL for a municipality."""
+    municipality_name = arguments["municipality_name"]
+    state_abbr = arguments["state_abbr"].lower()
+    
+    # Format the municipality name for URL (spaces to underscores, lowercase)
+    formatted_name = municipality_name.lower().translate(_SLUG_TABLE)
+    
+    url = f"{MUNICODE_LIBRARY_BASE}/{state_abbr}/{formatted_name}/codes/code_of_ordinances"
+    
+    return [TextContent(
+        type="text",
+        text=f"Municode Library URL for {municipality_name}, {state_abbr.upper()}:\n{url}"
+    )]
+
+
+async def _handle_get_code_subtree(arguments: Dict[str, Any]) -> List[TextContent]:
+    """Get several levels of a municipality's code table of contents."""
+    municipality_name = arguments["municipality_name"]
+    state_abbr = arguments["state_abbr"].upper()
+    node_id = arguments.get("node_id", "10121")
+    depth = max(1, min(int(arguments.get("depth", 2)), MAX_TOC_DEPTH))
+    
+    client_id, job_id, product_id = await municode_client.resolve_code_product(municipality_name, state_abbr)
+    
+    if not client_id:
+        return [TextContent(type="text", text=f"Municipality '{municipality_name}' not found in {state_abbr}")]
+    
+    if not job_id:
+        return [TextContent(type="text", text="No code of ordinances found for this municipality")]
+    
+    subtree = await municode_client.get_toc_subtree(job_id, product_id, node_id, depth)
+    
+    return [TextContent(
+        type="text",
+        text=_pretty(subtree, f"Code structure ({depth} levels) for {municipality_name}, {state_abbr}:\n\n")
+    )]
+
+
+# Tool name -> handler coroutine
+_TOOL_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[List[TextContent]]]] = {
+    "get_states_info": _handle_get_states_info,
+    "list_municipalities": _handle_list_municipalities,
+    "get_municipality_info": _handle_get_municipality_info,
+    "get_code_structure": _handle_get_code_structure,
+    "get_code_section": _handle_get_code_section,
+    "search_municipal_codes": _handle_search_municipal_codes,
+    "get_municipality_url": _handle_get_municipality_url,
+    "get_code_subtree": _handle_get_code_subtree,
+}
+
+
 @server.call_tool()
 async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
     """Handle tool calls."""
-    try:
-        if name == "get_states_info":
-            state_abbr = arguments["state_abbr"].upper()
-            result = await municode_client.get_states(state_abbr)
-            return [TextContent(type="text", text=json.dumps(result, indent=2))]
-        
-        elif name == "list_municipalities":
-            state_abbr = arguments["state_abbr"].upper()
-            clients = await municode_client.get_clients_by_state(state_abbr)
-            
-            # Format the output for better readability
-            formatted_clients = []
-            for client in clients:
-                formatted_clients.append({
-                    "name": client.get("ClientName", "Unknown"),
-                    "id": client.get("ClientID"),
-                    "population_range": client.get("PopRangeId"),
-                    "classification": client.get("ClassificationId"),
-                    "website": client.get("Website"),
-                    "city": client.get("City"),
-                    "zip_code": client.get("ZipCode")
-                })
-            
-            return [TextContent(
-                type="text", 
-                text=f"Found {len(formatted_clients)} municipalities in {state_abbr}:\n\n" + 
-                     json.dumps(formatted_clients, indent=2)
-            )]
-        
-        elif name == "get_municipality_info":
-            municipality_name = arguments["municipality_name"]
-            state_abbr = arguments["state_abbr"].upper()
-            
-            client_info = await municode_client.get_client_by_name(municipality_name, state_abbr)
-            client_id = client_info.get("ClientID")
-            
-            if client_id:
-                client_content = await municode_client.get_client_content(client_id)
-                
-                result = {
-                    "client_info": client_info,
-                    "available_products": client_content
-                }
-            else:
-                result = {"client_info": client_info}
-            
-            return [TextContent(type="text", text=json.dumps(result, indent=2))]
-        
-        elif name == "get_code_structure":
-            municipality_name = arguments["municipality_name"]
-            state_abbr = arguments["state_abbr"].upper()
-            node_id = arguments.get("node_id", "10121")
-            
-            # First get client info
-            client_info = await municode_client.get_client_by_name(municipality_name, state_abbr)
-            client_id = client_info.get("ClientID")
-            
-            if not client_id:
-                return [TextContent(type="text", text=f"Municipality '{municipality_name}' not found in {state_abbr}")]
-            
-            # Get available products
-            client_content = await municode_client.get_client_content(client_id)
-            
-            # Find the code of ordinances product
-            code_product = None
-            for product in client_content:
-                if "code" in product.get("ProductName", "").lower():
-                    code_product = product
-                    break
-            
-            if not code_product:
-                return [TextContent(type="text", text="No code of ordinances found for this municipality")]
-            
-            job_id = code_product.get("Id")
-            product_id = code_product.get("ProductID")
-            
-            # Get table of contents
-            toc = await municode_client.get_toc_children(job_id, product_id, node_id)
-            
-            return [TextContent(
-                type="text",
-                text=f"Code structure for {municipality_name}, {state_abbr}:\n\n" +
-                     json.dumps(toc, indent=2)
-            )]
-        
-        elif name == "get_code_section":
-            municipality_name = arguments["municipality_name"]
-            state_abbr = arguments["state_abbr"].upper()
-            node_id = arguments["node_id"]
-            
-            # Get client and product info
-            client_info = await municode_client.get_client_by_name(municipality_name, state_abbr)
-            client_id = client_info.get("ClientID")
-            
-            if not client_id:
-                return [TextContent(type="text", text=f"Municipality '{municipality_name}' not found in {state_abbr}")]
-            
-            client_content = await municode_client.get_client_content(client_id)
-            code_product = None
-            for product in client_content:
-                if "code" in product.get("ProductName", "").lower():
-                    code_product = product
-                    break
-            
-            if not code_product:
-                return [TextContent(type="text", text="No code of ordinances found for this municipality")]
-            
-            job_id = code_product.get("Id")
-            product_id = code_product.get("ProductID")
-            
-            # Get the content
-            content = await municode_client.get_codes_content(job_id, product_id, node_id)
-            
-            return [TextContent(
-                type="text",
-                text=f"Content for node {node_id} in {municipality_name}, {state_abbr}:\n\n" +
-                     json.dumps(content, indent=2)
-            )]
-        
-        elif name == "search_municipal_codes":
-            municipality_name = arguments["municipality_name"]
-            state_abbr = arguments["state_abbr"].upper()
-            search_query = arguments["search_query"]
-            page_size = arguments.get("page_size", 10)
-            page_number = arguments.get("page_number", 1)
-            titles_only = arguments.get("titles_only", False)
-            
-            # Get client info
-            client_info = await municode_client.get_client_by_name(municipality_name, state_abbr)
-            client_id = client_info.get("ClientID")
-            
-            if not client_id:
-                return [TextContent(type="text", text=f"Municipality '{municipality_name}' not found in {state_abbr}")]
-            
-            # Perform search
-            search_results = await municode_client.search_munidocs(
-                client_id=client_id,
-                search_text=search_query,
-                page_num=page_number,
-                page_size=page_size,
-                titles_only=titles_only
-            )
-            
-            return [TextContent(
-                type="text",
-                text=f"Search results for '{search_query}' in {municipality_name}, {state_abbr}:\n\n" +
-                     json.dumps(search_results, indent=2)
-            )]
-        
-        elif name == "get_municipality_url":
-            municipality_name = arguments["municipality_name"]
-            state_abbr = arguments["state_abbr"].lower()
-            
-            # Format the municipality name for URL (spaces to underscores, lowercase)
-            formatted_name = municipality_name.lower().replace(" ", "_").replace(",", "")
-            
-            url = f"{MUNICODE_LIBRARY_BASE}/{state_abbr}/{formatted_name}/codes/code_of_ordinances"
-            
-            return [TextContent(
-                type="text",
-                text=f"Municode Library URL for {municipality_name}, {state_abbr.upper()}:\n{url}"
-            )]
-        
-        else:
-            return [TextContent(type="text", text=f"Unknown tool: {name}")]
+    handler = _TOOL_HANDLERS.get(name)
+    if handler is None:
+        return [TextContent(type="text", text=f"Unknown tool: {name}")]
     
+    try:
+        return await handler(arguments)
     except Exception as e:
-        logger.error(f"Error in tool {name}: {str(e)}")
+        logger.error("Error in tool %s: %s", name, e)
         return [TextContent(type="text", text=f"Error: {str(e)}")]
 
 
-@server.list_resources()
-async def handle_list_resources() -> List[Resource]:
-    """List available resources."""
-    return [
-        Resource(
-            uri="municode://help",
-            name="Municode MCP Server Help",
-            description="Documentation for using the Municode MCP server",
-            mimeType="text/plain"
-        )
-    ]
-
-
-@server.read_resource()
-async def handle_read_resource(uri: str) -> str:
-    """Handle resource reads."""
-    if uri == "municode://help":
-        return """
+# Help text served by the municode://help resource
+_HELP_TEXT = """
 # Municode MCP Server
 
 This server provides access to municipal codes and ordinances through the Municode digital library.
@@ -517,6 +874,7 @@ This server provides access to municipal codes and ordinances through the Munico
 5. **get_code_section** - Get the content of a specific section of municipal code
 6. **search_municipal_codes** - Search through municipal codes and ordinances
 7. **get_municipality_url** - Get the URL for a municipality's code library page
+8. **get_code_subtree** - Get several levels of a municipality's code structure in one call
 
 ## Example Usage:
 
@@ -544,29 +902,69 @@ This server provides access to municipal codes and ordinances through the Munico
 - The API uses unofficial endpoints that may change
 
 Based on the unofficial Municode API documentation.
-        """
+"""
+
+
+@server.list_resources()
+async def handle_list_resources() -> List[Resource]:
+    """List available resources."""
+    return [
+        Resource(
+            uri="municode://help",
+            name="Municode MCP Server Help",
+            description="Documentation for using the Municode MCP server",
+            mimeType="text/plain"
+        )
+    ]
+
+
+@server.read_resource()
+async def handle_read_resource(uri: str) -> str:
+    """Handle resource reads."""
+    if uri == "municode://help":
+        return _HELP_TEXT
     
     raise ValueError(f"Unknown resource: {uri}")
 
 
+async def _keepalive_loop():
+    """Periodically touch the Municode API so pooled connections stay open.
+    
+    Pings pause once the server has been idle for KEEPALIVE_IDLE_TIMEOUT and
+    resume after the next API request.
+    """
+    url = f"{MUNICODE_API_BASE}/States/abbr"
+    while True:
+        if time.monotonic() - municode_client.last_used < KEEPALIVE_IDLE_TIMEOUT:
+            try:
+                await municode_client.client.head(url, params={"stateAbbr": "VA"})
+            except httpx.HTTPError as e:
+                logger.debug("Keepalive request failed: %s", e)
+        await asyncio.sleep(KEEPALIVE_INTERVAL)
+
+
 async def main():
     """Run the server."""
     # Import here to avoid issues if mcp package is not available
     from mcp.server.stdio import stdio_server
     
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream, 
-            write_stream, 
-            InitializationOptions(
-                server_name="municode",
-                server_version="1.0.0",
-                capabilities=ServerCapabilities(
-                    tools={"listChanged": True},
-                    resources={"listChanged": True, "subscribe": True}
+    keepalive_task = asyncio.create_task(_keepalive_loop())
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream, 
+                write_stream, 
+                InitializationOptions(
+                    server_name="municode",
+                    server_version="1.0.0",
+                    capabilities=ServerCapabilities(
+                        tools={"listChanged": True},
+                        resources={"listChanged": True, "subscribe": True}
+                    )
                 )
             )
-        )
+    finally:
+        keepalive_task.cancel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Offline tests for the MunicipalMCP server
+Exercises MunicodeClient against stubbed Municode responses, so no network
+access is required. Exits with a non-zero status if any check fails.
+"""
+
+import asyncio
+import importlib.util
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+
+# The server script's filename contains hyphens, so load it by path
+_SERVER_PATH = Path(__file__).resolve().parent / "municode-mcp-server.py"
+_spec = importlib.util.spec_from_file_location("municode_mcp_server", _SERVER_PATH)
+municode_mcp_server = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(municode_mcp_server)
+
+
+async def make_client(handler):
+    """Create a MunicodeClient whose requests are answered by handler."""
+    client = municode_mcp_server.MunicodeClient()
+    await client.client.aclose()
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+@contextmanager
+def patched(name, value):
+    """Temporarily override a server module constant."""
+    original = getattr(municode_mcp_server, name)
+    setattr(municode_mcp_server, name, value)
+    try:
+        yield
+    finally:
+        setattr(municode_mcp_server, name, original)
+
+
+def json_handler(requests, body_size=16):
+    """Answer every request with a JSON string of roughly body_size bytes."""
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json="x" * body_size)
+    return handler
+
+
+def api_url(path):
+    """Build a Municode API URL for the given path."""
+    return f"{municode_mcp_server.MUNICODE_API_BASE}/{path}"
+
+
+def gated_handler(requests, gate):
+    """Answer requests with a small JSON string once gate is set."""
+    async def handler(request):
+        requests.append(request)
+        await gate.wait()
+        return httpx.Response(200, json="x" * 16)
+    return handler
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the redis.asyncio client."""
+
+    def __init__(self, fail=False):
+        self.store = {}
+        self.deleted = []
+        self.fail = fail
+
+    def _check(self):
+        if self.fail:
+            raise municode_mcp_server.RedisError("Redis unavailable")
+
+    async def get(self, key):
+        self._check()
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self._check()
+        self.store[key] = value
+
+    async def delete(self, key):
+        self._check()
+        self.deleted.append(key)
+        self.store.pop(key, None)
+
+    async def aclose(self):
+        pass
+
+
+def wide_toc_handler(width, requests):
+    """Answer codesToc/children requests with `width` expandable children per node."""
+    def handler(request):
+        requests.append(request)
+        node_id = request.url.params["nodeId"]
+        children = [{"Id": f"{node_id}.{i}", "Heading": f"Node {i}", "HasChildren": True} for i in range(width)]
+        return httpx.Response(200, json=children)
+    return handler
+
+
+def count_nested(nodes):
+    """Count the nodes nested below the given level."""
+    return sum(len(node.get("Children", [])) + count_nested(node.get("Children", [])) for node in nodes)
+
+
+async def test_subtree_budget():
+    """A wide table of contents is bounded in both requests and returned nodes."""
+    requests = []
+    client = await make_client(wide_toc_handler(30, requests))
+    try:
+        subtree = await client.get_toc_subtree(1, 2, depth=3)
+        nested = count_nested(subtree)
+        assert nested <= municode_mcp_server.MAX_TOC_NODES, f"{nested} nested nodes returned"
+        assert any(node.get("Children") for node in subtree), "no nested Children returned"
+        max_requests = 1 + municode_mcp_server.MAX_TOC_NODES // 30 + municode_mcp_server.TOC_FETCH_CONCURRENCY
+        assert len(requests) <= max_requests, f"{len(requests)} TOC requests issued"
+
+        root = await client.get_toc_children(1, 2)
+        assert not any("Children" in node for node in root), "cached TOC list was mutated"
+    finally:
+        await client.close()
+
+
+async def test_subtree_full_depth():
+    """A narrow table of contents is expanded to the full requested depth."""
+    requests = []
+    client = await make_client(wide_toc_handler(5, requests))
+    try:
+        subtree = await client.get_toc_subtree(1, 2, depth=3)
+        assert count_nested(subtree) == 5 * 5 + 5 * 5 * 5, f"{count_nested(subtree)} nested nodes returned"
+        assert all(child.get("Children") for node in subtree for child in node["Children"])
+        assert len(requests) == 1 + 5 + 25, f"{len(requests)} TOC requests issued"
+    finally:
+        await client.close()
+
+
+async def test_memory_cache_hit():
+    """A repeated request is served from the in-process cache."""
+    requests = []
+    client = await make_client(json_handler(requests))
+    try:
+        first = await client._cached_get(api_url("a"))
+        second = await client._cached_get(api_url("a"))
+        assert first == second
+        assert len(requests) == 1, f"{len(requests)} requests issued"
+    finally:
+        await client.close()
+
+
+async def test_memory_cache_evicts_by_count():
+    """The least recently used entry is evicted once the entry limit is reached."""
+    requests = []
+    client = await make_client(json_handler(requests))
+    try:
+        with patched("MEMORY_CACHE_SIZE", 2):
+            await client._cached_get(api_url("a"))
+            await client._cached_get(api_url("b"))
+            await client._cached_get(api_url("a"))  # refresh "a" so "b" is least recent
+            await client._cached_get(api_url("c"))
+            assert len(client._memory_cache) == 2
+            await client._cached_get(api_url("a"))
+            assert len(requests) == 3, f"'a' was evicted ({len(requests)} requests)"
+            await client._cached_get(api_url("b"))
+            assert len(requests) == 4, f"'b' was not evicted ({len(requests)} requests)"
+    finally:
+        await client.close()
+
+
+async def test_memory_cache_evicts_by_bytes():
+    """Entries are evicted once their estimated size exceeds the byte budget."""
+    requests = []
+    client = await make_client(json_handler(requests, body_size=100))
+    try:
+        entry_size = 102 * municode_mcp_server.MEMORY_CACHE_DECODED_FACTOR
+        with patched("MEMORY_CACHE_MAX_BYTES", entry_size * 2):
+            for path in ("a", "b", "c"):
+                await client._cached_get(api_url(path))
+            assert len(client._memory_cache) == 2, f"{len(client._memory_cache)} entries cached"
+            assert client._memory_bytes == entry_size * 2, f"{client._memory_bytes} bytes tracked"
+    finally:
+        await client.close()
+
+
+async def test_memory_cache_skips_oversized():
+    """A body larger than the byte budget is returned but not cached in memory."""
+    requests = []
+    client = await make_client(json_handler(requests, body_size=1000))
+    try:
+        with patched("MEMORY_CACHE_MAX_BYTES", 1000):
+            data = await client._cached_get(api_url("big"))
+            assert data == "x" * 1000
+            assert not client._memory_cache and client._memory_bytes == 0
+            await client._cached_get(api_url("big"))
+            assert len(requests) == 2, f"{len(requests)} requests issued"
+    finally:
+        await client.close()
+
+
+async def test_memory_cache_expires():
+    """An expired entry is dropped and fetched again."""
+    requests = []
+    client = await make_client(json_handler(requests))
+    try:
+        await client._cached_get(api_url("a"), ttl=0)
+        await asyncio.sleep(0.01)
+        await client._cached_get(api_url("a"), ttl=0)
+        assert len(requests) == 2, f"{len(requests)} requests issued"
+        assert len(client._memory_cache) == 1
+    finally:
+        await client.close()
+
+
+async def test_single_flight():
+    """Concurrent identical requests share one fetch."""
+    requests = []
+    gate = asyncio.Event()
+    client = await make_client(gated_handler(requests, gate))
+    try:
+        waiters = [asyncio.ensure_future(client._cached_get(api_url("a"))) for _ in range(10)]
+        await asyncio.sleep(0.01)
+        gate.set()
+        results = await asyncio.gather(*waiters)
+        assert results == ["x" * 16] * 10
+        assert len(requests) == 1, f"{len(requests)} requests issued"
+        assert not client._inflight, "in-flight fetch was not cleared"
+    finally:
+        await client.close()
+
+
+async def test_single_flight_survives_cancellation():
+    """Cancelling one caller does not cancel the fetch shared with the others."""
+    requests = []
+    gate = asyncio.Event()
+    client = await make_client(gated_handler(requests, gate))
+    try:
+        first = asyncio.ensure_future(client._cached_get(api_url("a")))
+        second = asyncio.ensure_future(client._cached_get(api_url("a")))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        gate.set()
+        try:
+            assert await second == "x" * 16
+        except asyncio.CancelledError:
+            raise AssertionError("cancelling one caller cancelled the shared fetch")
+        assert first.cancelled()
+        assert len(requests) == 1, f"{len(requests)} requests issued"
+        assert not client._inflight, "in-flight fetch was not cleared"
+        await client._cached_get(api_url("a"))
+        assert len(requests) == 1, "shared fetch result was not cached"
+    finally:
+        await client.close()
+
+
+async def test_redis_hit_and_miss():
+    """A response cached in Redis by one client is served to another without a request."""
+    requests = []
+    redis = FakeRedis()
+    first = await make_client(json_handler(requests))
+    second = await make_client(json_handler(requests))
+    first.redis = second.redis = redis
+    try:
+        data = await first._cached_get(api_url("a"))
+        assert len(requests) == 1 and len(redis.store) == 1
+        assert await second._cached_get(api_url("a")) == data
+        assert len(requests) == 1, f"{len(requests)} requests issued"
+    finally:
+        await first.close()
+        await second.close()
+
+
+async def test_redis_corrupt_entry_is_a_miss():
+    """An undecodable Redis value is deleted and the response fetched again."""
+    requests = []
+    client = await make_client(json_handler(requests))
+    client.redis = FakeRedis()
+    try:
+        key = municode_mcp_server._cache_key(api_url("a"))
+        client.redis.store[key] = b"{not json"
+        assert await client._cached_get(api_url("a")) == "x" * 16
+        assert client.redis.deleted == [key], "corrupt entry was not deleted"
+        assert len(requests) == 1, f"{len(requests)} requests issued"
+        value, _ = await client._redis_get(key)
+        assert value == "x" * 16, "fresh response was not stored"
+    finally:
+        await client.close()
+
+
+async def test_redis_errors_fall_back_to_network():
+    """Redis failures are logged and the request goes to the network."""
+    requests = []
+    client = await make_client(json_handler(requests))
+    client.redis = FakeRedis(fail=True)
+    try:
+        assert await client._cached_get(api_url("a")) == "x" * 16
+        assert len(requests) == 1, f"{len(requests)} requests issued"
+    finally:
+        await client.close()
+
+
+async def test_redis_plain_entries():
+    """Without zstandard, entries are stored as plain JSON and read back."""
+    client = municode_mcp_server.MunicodeClient()
+    client.redis = FakeRedis()
+    try:
+        with patched("_zstd_compressor", None):
+            await client._redis_set("k", {"a": "x" * 100}, 60)
+        assert client.redis.store["k"] == b'{"a":"' + b"x" * 100 + b'"}'
+        data, size = await client._redis_get("k")
+        assert data == {"a": "x" * 100} and size == len(client.redis.store["k"])
+    finally:
+        await client.close()
+
+
+async def test_redis_compressed_entries():
+    """With zstandard, entries are compressed and plain entries still read back."""
+    if municode_mcp_server.zstandard is None:
+        print("   ⏭️  zstandard not installed; skipping compressed entry checks")
+        return
+    client = municode_mcp_server.MunicodeClient()
+    client.redis = FakeRedis()
+    try:
+        body = {"a": "x" * 1000}
+        await client._redis_set("zstd", body, 60)
+        stored = client.redis.store["zstd"]
+        assert stored.startswith(municode_mcp_server.ZSTD_MAGIC), "entry was not compressed"
+        assert len(stored) < 1000, f"compressed entry is {len(stored)} bytes"
+        data, size = await client._redis_get("zstd")
+        assert data == body and size == len(b'{"a":"' + b"x" * 1000 + b'"}'), "size is not the uncompressed size"
+
+        client.redis.store["plain"] = b'{"a":1}'
+        assert await client._redis_get("plain") == ({"a": 1}, 7)
+
+        with patched("_zstd_decompressor", None):
+            data, _ = await client._redis_get("zstd")
+        assert data is municode_mcp_server._MISSING
+        assert not client.redis.deleted, "readable entry was deleted"
+    finally:
+        await client.close()
+
+
+async def run_tests():
+    """Run every check and report the results."""
+    tests = [
+        test_memory_cache_hit,
+        test_memory_cache_evicts_by_count,
+        test_memory_cache_evicts_by_bytes,
+        test_memory_cache_skips_oversized,
+        test_memory_cache_expires,
+        test_single_flight,
+        test_single_flight_survives_cancellation,
+        test_redis_hit_and_miss,
+        test_redis_corrupt_entry_is_a_miss,
+        test_redis_errors_fall_back_to_network,
+        test_redis_plain_entries,
+        test_redis_compressed_entries,
+        test_subtree_budget,
+        test_subtree_full_depth,
+    ]
+
+    print("🏛️  Running offline MunicodeClient tests\n")
+    failures = 0
+    for test in tests:
+        try:
+            await test()
+            print(f"   ✅ {test.__name__}")
+        except Exception as e:
+            failures += 1
+            print(f"   ❌ {test.__name__}: {e!r}")
+
+    await municode_mcp_server.municode_client.close()
+    print(f"\n{len(tests) - failures}/{len(tests)} checks passed")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if asyncio.run(run_tests()) else 0)
@@ -5,90 +5,20 @@ Tests basic functionality without requiring full MCP client setup.
 """
 
 import asyncio
-import json
-import logging
-from typing import Any, Dict, List
-import httpx
+import importlib.util
+from pathlib import Path
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# Municode API base URL
-MUNICODE_API_BASE = "https://api.municode.com"
-
-class MunicodeClient:
-    """HTTP client for interacting with Municode API."""
-    
-    def __init__(self):
-        self.client = httpx.AsyncClient(
-            timeout=30.0,
-            headers={
-                "User-Agent": "MCP-Municode-Server/1.0",
-                "Accept": "application/json",
-            }
-        )
-    
-    async def close(self):
-        """Close the HTTP client."""
-        await self.client.aclose()
-    
-    async def get_states(self, state_abbr: str) -> Dict[str, Any]:
-        """Get state information by abbreviation."""
-        url = f"{MUNICODE_API_BASE}/States/abbr"
-        params = {"stateAbbr": state_abbr}
-        response = await self.client.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
-    
-    async def get_clients_by_state(self, state_abbr: str) -> List[Dict[str, Any]]:
-        """Get all Municode clients in a state."""
-        url = f"{MUNICODE_API_BASE}/Clients/stateAbbr"
-        params = {"stateAbbr": state_abbr}
-        response = await self.client.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
-    
-    async def get_client_by_name(self, client_name: str, state_abbr: str) -> Dict[str, Any]:
-        """Get client information by name and state."""
-        url = f"{MUNICODE_API_BASE}/Clients/name"
-        params = {"clientName": client_name, "stateAbbr": state_abbr}
-        response = await self.client.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
-    
-    async def search_munidocs(
-        self,
-        client_id: int,
-        search_text: str,
-        page_num: int = 1,
-        page_size: int = 10,
-        titles_only: bool = False
-    ) -> Dict[str, Any]:
-        """Search MuniDocs for a word or phrase."""
-        url = f"{MUNICODE_API_BASE}/search"
-        params = {
-            "clientId": client_id,
-            "searchText": search_text,
-            "pageNum": page_num,
-            "pageSize": page_size,
-            "titlesOnly": titles_only,
-            "isAdvanced": False,
-            "isAutocomplete": False,
-            "mode": "standard",
-            "sort": 0,
-            "fragmentSize": 200,
-            "contentTypeId": "",
-            "stateId": 0
-        }
-        response = await self.client.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+# The server script's filename contains hyphens, so load it by path
+_SERVER_PATH = Path(__file__).resolve().parent / "municode-mcp-server.py"
+_spec = importlib.util.spec_from_file_location("municode_mcp_server", _SERVER_PATH)
+municode_mcp_server = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(municode_mcp_server)
 
 
 async def test_municode_client():
     """Test the Municode API client directly."""
-    client = MunicodeClient()
+    # Reuse the server's module-level client so only one HTTP client is opened
+    client = municode_mcp_server.municode_client
     
     try:
         print("🏛️  Testing Municode API Client\n")
@@ -172,6 +102,30 @@ async def test_municode_client():
         except Exception as e:
             print(f"   ❌ Error: {e}")
         
+        # Test 5: Fetch two levels of the code structure in one call
+        print("\n5. Getting two levels of Norfolk's code structure...")
+        try:
+            _, job_id, product_id = await client.resolve_code_product("Norfolk", "VA")
+            if not job_id:
+                print("   ❌ No code of ordinances found for Norfolk")
+                return
+            
+            subtree = await client.get_toc_subtree(job_id, product_id, depth=2)
+            nested = [node for node in subtree if node.get("Children")]
+            print(f"   ✅ Found {len(subtree)} top-level nodes, {len(nested)} with nested children")
+            if not nested:
+                print("   ❌ No nested Children returned")
+            
+            # The subtree must be built from copies, leaving cached TOC lists untouched
+            root_children = await client.get_toc_children(job_id, product_id)
+            if any("Children" in node for node in root_children):
+                print("   ❌ Cached table of contents was mutated")
+            else:
+                print("   ✅ Cached table of contents left unmodified")
+                
+        except Exception as e:
+            print(f"   ❌ Error: {e}")
+        
         print("\n🎉 Test completed!")
         
     finally: